@@ -1,8 +1,13 @@
 import time
 import random
 import threading
+import queue
 import datetime
 import logging
+import os
+from collections import Counter, OrderedDict, defaultdict, deque
+import numpy as np
+from backend.cameras import CAMERA_CONFIG
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,25 +17,178 @@ logger = logging.getLogger("TrafficAI")
 try:
     from ultralytics import YOLO
     import cv2
-    import numpy as np
     AI_AVAILABLE = True
     logger.info("YOLOv8 and OpenCV detected. Real-time AI mode available.")
 except ImportError:
     AI_AVAILABLE = False
     logger.warning("YOLOv8/OpenCV not found. Running in MOCK/SIMULATION mode.")
 
+# OpenCV's CUDA module is only present in custom/contrib CUDA builds
+CUDA_CV_AVAILABLE = False
+if AI_AVAILABLE:
+    try:
+        CUDA_CV_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except Exception:
+        pass
+# NVDEC hardware decoding additionally needs OpenCV built with cudacodec
+CUDA_CODEC_AVAILABLE = CUDA_CV_AVAILABLE and hasattr(cv2, "cudacodec")
+if CUDA_CODEC_AVAILABLE:
+    logger.info("OpenCV cudacodec detected. Frames are decoded and resized on the GPU.")
+
+# Prefer orjson for parsing the (large) Overpass responses
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    import json
+    json_loads = json.loads
+    json_dumps = lambda obj: json.dumps(obj).encode("utf-8")
+
+# Try importing the libjpeg-turbo encoder (much faster than cv2.imencode)
+try:
+    from turbojpeg import TurboJPEG
+    jpeg_encoder = TurboJPEG()
+    logger.info("PyTurboJPEG detected. Using libjpeg-turbo for stream encoding.")
+except Exception as e: # Missing package or missing libturbojpeg shared library
+    jpeg_encoder = None
+    logger.info(f"PyTurboJPEG unavailable ({e}). Using OpenCV for stream encoding.")
+
+MODEL_PATH = "yolov8n.pt"
+TRACKER_CFG = "botsort.yaml" # Ultralytics tracker config, one tracker per camera (see _process_cameras)
+ENGINE_CHOICE_FILE = "engine.json" # Engine picked by export_engine.py after its accuracy/latency check
+FP16_ENGINE = "yolov8n_fp16.engine" # Used when no choice was recorded (INT8 is only loaded once validated)
+ENGINE_ENV = "TRAFFIC_ENGINE" # Env override forcing an engine path, e.g. TRAFFIC_ENGINE=yolov8n_fp16.engine
+FRAME_SIZE = (1024, 576) # (width, height) fed to the model
+MAX_ENTRIES = 2000 # Detection entries kept in memory
+DEFAULT_FPS = 30.0 # Used when a video doesn't report its frame rate
+RECENT_WINDOW = 5.0 # Seconds of detections that count towards the live load
+MAX_TRACKED_IDS = 100000 # Most recently seen track IDs kept for the vehicle count
+JPEG_QUALITY = 75 # Quality of the streamed MJPEG frames
+OSM_CACHE_DIR = ".cache" # Parsed Overpass road points, one JSON file per query
+OSM_CACHE_MAX_AGE = 30 * 24 * 3600 # Seconds before cached road geometry is refetched
+# Hardcoded coordinates to align with actual roads, used until/unless OSM data arrives
+FALLBACK_ROAD_POINTS = [
+    # --- Seaport-Airport Road (Main Artery) ---
+    (10.0300, 76.3115), (10.0290, 76.3116), (10.0280, 76.3117),
+    (10.0270, 76.3118), (10.0260, 76.3119), (10.0250, 76.3120),
+    (10.0240, 76.3121), (10.0230, 76.3122), (10.0220, 76.3123),
+    (10.0210, 76.3124),
+    (10.0250, 76.3090), (10.0250, 76.3100), (10.0250, 76.3110),
+    (10.0252, 76.3130), (10.0253, 76.3140), (10.0255, 76.3150)
+]
+# Model class labels counted as vehicles, mapped to our vehicle types
+VEHICLE_LABELS = {"car": "car", "motorcycle": "bike", "bus": "bus", "truck": "truck"}
+# Congestion levels, indexed by the code computed in get_latest_data: (intensity, weighted_intensity)
+INTENSITY_LEVELS = [("low", 0.2), ("moderate", 0.5), ("congestion", 1.0)] # 'congestion' maps to Red
+
+class VideoSource:
+    """
+    Looping video file that yields BGR frames resized to FRAME_SIZE.
+    Decodes with NVDEC (cv2.cudacodec) and resizes on the GPU when available,
+    so full-size frames never touch host memory. CPU-decoded frames are resized
+    on the CPU, uploading them just to resize would add a PCIe round trip.
+    """
+    def __init__(self, src):
+        self.src = src
+        self.use_cudacodec = CUDA_CODEC_AVAILABLE
+        # Reused GPU output buffers for the cudacodec path (allocated on first use)
+        self.gpu_resized = cv2.cuda_GpuMat() if self.use_cudacodec else None
+        self.gpu_bgr = cv2.cuda_GpuMat() if self.use_cudacodec else None
+        self.reader = self._open()
+        self.fps = self._source_fps()
+        self.next_frame_time = None # Monotonic time the next frame is due at native fps
+
+    def _open(self):
+        if self.use_cudacodec:
+            try:
+                return cv2.cudacodec.createVideoReader(self.src)
+            except cv2.error as e:
+                logger.warning(f"NVDEC decode unavailable for {self.src} ({e}). Decoding on CPU.")
+                self.use_cudacodec = False
+        return cv2.VideoCapture(self.src)
+
+    def _source_fps(self):
+        try:
+            fps = self.reader.format().fps if self.use_cudacodec else self.reader.get(cv2.CAP_PROP_FPS)
+        except Exception:
+            fps = 0
+        return fps if fps and fps > 0 else DEFAULT_FPS
+
+    def isOpened(self):
+        return self.use_cudacodec or self.reader.isOpened()
+
+    def _read_raw(self):
+        if self.use_cudacodec:
+            return self.reader.nextFrame()
+        return self.reader.read()
+
+    def read(self):
+        ret, frame = self._read_raw()
+        if not ret:
+            # Loop video
+            logger.debug(f"Looping {self.src}")
+            self.rewind()
+            ret, frame = self._read_raw()
+            if not ret:
+                return False, None
+        return True, self._resize(frame)
+
+    def read_latest(self):
+        """
+        Like read(), but keeps the video in real time at its native fps: frames that
+        fell due while we were busy are grabbed (decoded, not retrieved) and skipped,
+        so we never process a stale backlog.
+        """
+        now = time.monotonic()
+        if self.next_frame_time is None:
+            self.next_frame_time = now
+        behind = max(0, int((now - self.next_frame_time) * self.fps))
+        for _ in range(behind):
+            if not self.reader.grab():
+                self.rewind()
+        self.next_frame_time += (behind + 1) / self.fps
+        return self.read()
+
+    def rewind(self):
+        if self.use_cudacodec:
+            # cudacodec readers can't seek, start a fresh one instead
+            self.reader = cv2.cudacodec.createVideoReader(self.src)
+        else:
+            self.reader.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _resize(self, frame):
+        # The result stays BGR on the host: ultralytics does its own BGR->RGB and
+        # the annotated plot needs the host image anyway.
+        if self.use_cudacodec:
+            gpu_frame = cv2.cuda.resize(frame, FRAME_SIZE, self.gpu_resized)
+            if gpu_frame.channels() == 4: # NVDEC output is BGRA
+                gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR, self.gpu_bgr)
+            return gpu_frame.download()
+        return cv2.resize(frame, FRAME_SIZE)
+
+    def release(self):
+        if not self.use_cudacodec:
+            self.reader.release()
+
 class TrafficAnalyzer:
     def __init__(self, mode="auto"):
         self.lock = threading.Lock()
-        self.data = []
-        # UPDATED LOCATION: 10°01'22.4"N 76°18'34.2"E -> 10.0229, 76.3095
-        self.camera_config = [
-            {"id": "CAM_002", "lat": 10.0229, "lng": 76.3095, "name": "Seaport-Airport Rd", "file": "traffic_cam2.mp4", "source_type": "live_cctv", "lanes": 8}
-        ]
-        self.unique_ids = set() # Store unique vehicle track IDs
+        self.data = deque(maxlen=MAX_ENTRIES) # Oldest entries are evicted automatically
+        # Running aggregates over self.data, kept in sync by _store_entry
+        self.by_type_counter = Counter()
+        self.by_cam_type_counter = defaultdict(Counter)
+        # Per camera: (epoch_ts, track_id_set, count) for the last RECENT_WINDOW seconds
+        self.recent = defaultdict(deque)
+        # Per camera: how many frames in the window each track ID appears in (its keys are the unique IDs)
+        self.recent_id_counts = defaultdict(Counter)
+        self.camera_config = CAMERA_CONFIG # See backend/cameras.py
+        self.camera_by_id = {c['id']: c for c in self.camera_config}
+        self.recent_ids = OrderedDict() # Unique vehicle track IDs, least recently seen first (capped at MAX_TRACKED_IDS)
         self.vehicle_types = ["car", "bike", "bus", "truck"]
         self.running = True
-        self.current_frames = {} # Store latest JPG bytes for each camera
+        self.current_frames = {} # Store latest JPG bytes for each camera (swapped atomically, read without self.lock)
+        self.encode_queues = {} # Latest annotated frame waiting to be JPEG encoded, per camera
         
         # Decide mode
         if mode == "real" and not AI_AVAILABLE:
@@ -43,43 +201,22 @@ class TrafficAnalyzer:
             
         logger.info(f"Traffic Analyzer starting in {self.mode.upper()} mode.")
 
-        # Initialize Dummy Nodes (Simulated Data)
         # Initialize Dummy Nodes (Simulated Data on Roads)
-        self.dummy_nodes = []
-        
-        # Hardcoded coordinates to align with actual roads near 10.025, 76.312
-        # Roughly representing a North-South and East-West intersection pattern
-        # Try to fetch REAL road geometry from OpenStreetMap
-        # Try to fetch REAL road geometry from OpenStreetMap around the NEW location
-        road_points = self.fetch_road_geometry(10.0229, 76.3095)
-        
-        if not road_points:
-             # Fallback to Hardcoded coordinates if API fails
-            logger.warning("OSM Fetch failed, using fallback coordinates.")
-            road_points = [
-                # --- Seaport-Airport Road (Main Artery) ---
-                (10.0300, 76.3115), (10.0290, 76.3116), (10.0280, 76.3117),
-                (10.0270, 76.3118), (10.0260, 76.3119), (10.0250, 76.3120),
-                (10.0240, 76.3121), (10.0230, 76.3122), (10.0220, 76.3123),
-                (10.0210, 76.3124),
-                (10.0250, 76.3090), (10.0250, 76.3100), (10.0250, 76.3110),
-                (10.0252, 76.3130), (10.0253, 76.3140), (10.0255, 76.3150)
-            ]
-
-        for i, (r_lat, r_lng) in enumerate(road_points):
-            self.dummy_nodes.append({
-                "lat": r_lat,
-                "lng": r_lng,
-                "id": f"DUMMY_{i}",
-                "name": f"Sensor Node #{i+1}",
-                "source_type": "simulated_cctv"
-            })
+        # Start on the fallback coordinates and fetch REAL road geometry from OpenStreetMap
+        # in the background, so startup doesn't block on the Overpass API
+        self._set_road_points(FALLBACK_ROAD_POINTS)
+        osm_thread = threading.Thread(target=self._load_road_geometry, args=(10.0229, 76.3095))
+        osm_thread.daemon = True
+        osm_thread.start()
 
         # Initialize AI
         self.model = None
+        self.model_path = MODEL_PATH
+        self.predict_kwargs = {}
         if self.mode == "real":
             try:
-                self.model = YOLO('yolov8n.pt') 
+                self.model = self._load_model()
+                self.class_map = self._build_class_map(self.model.names)
             except Exception as e:
                 logger.error(f"Failed to load YOLO model: {e}")
                 self.mode = "mock"
@@ -88,11 +225,101 @@ class TrafficAnalyzer:
         self.thread.daemon = True
         self.thread.start()
     
+    def _load_model(self):
+        """
+        Loads the TensorRT engine chosen by export_engine.py (or forced through ENGINE_ENV),
+        falling back to the FP16 engine and then to the stock PyTorch weights (FP16 on CUDA).
+        """
+        forced = os.environ.get(ENGINE_ENV)
+        candidates = [forced] if forced else [self._recorded_engine(), FP16_ENGINE]
+        # Engines are built for a fixed input size, so pin imgsz to it
+        engine_kwargs = {"imgsz": (FRAME_SIZE[1], FRAME_SIZE[0])}
+        for path in dict.fromkeys(candidates): # Drop duplicates, keep the order
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                model = YOLO(path, task="detect")
+                # Engines load lazily, so the warm-up also surfaces a missing TensorRT or a bad engine
+                self._warm_up(model, engine_kwargs)
+            except Exception as e:
+                logger.error(f"Failed to load TensorRT engine {path}: {e}")
+                continue
+            logger.info(f"Loading TensorRT engine {path}")
+            self.model_path = path
+            self.predict_kwargs = engine_kwargs
+            return model
+        if forced:
+            logger.warning(f"{ENGINE_ENV}={forced} is not a usable engine, falling back to {MODEL_PATH}.")
+
+        import torch
+        if torch.cuda.is_available():
+            # Half precision roughly halves latency on GPU, ultralytics casts inputs for us
+            self.predict_kwargs = {"half": True}
+        return YOLO(MODEL_PATH)
+
+    @staticmethod
+    def _recorded_engine():
+        """Returns the engine path recorded by export_engine.py, or None."""
+        try:
+            with open(ENGINE_CHOICE_FILE, "rb") as f:
+                return json_loads(f.read()).get("engine")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _build_class_map(self, names):
+        """
+        Lookup array from model class id to index in self.vehicle_types (-1 = not a vehicle).
+        """
+        class_map = np.full(max(names) + 1, -1, dtype=np.int8)
+        for cls_id, label in names.items():
+            v_type = VEHICLE_LABELS.get(label.lower())
+            if v_type is not None:
+                class_map[cls_id] = self.vehicle_types.index(v_type)
+        return class_map
+
+    @staticmethod
+    def _warm_up(model, predict_kwargs):
+        """Runs a few blank frames through the model so the first camera frame isn't slow."""
+        frame = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+        for _ in range(3):
+            model.predict(frame, verbose=False, **predict_kwargs)
+
+    def _set_road_points(self, road_points):
+        # Build the full list before swapping it in, readers never see a partial list
+        self.dummy_nodes = [
+            {
+                "lat": r_lat,
+                "lng": r_lng,
+                "id": f"DUMMY_{i}",
+                "name": f"Sensor Node #{i+1}",
+                "source_type": "simulated_cctv"
+            }
+            for i, (r_lat, r_lng) in enumerate(road_points)
+        ]
+
+    def _load_road_geometry(self, lat, lng):
+        road_points = self.fetch_road_geometry(lat, lng)
+        if road_points:
+            self._set_road_points(road_points)
+        else:
+            logger.warning("OSM Fetch failed, using fallback coordinates.")
+
     def fetch_road_geometry(self, lat, lng, radius=200):
         """
         Fetches road coordinates from OpenStreetMap using Overpass API.
+        Results are cached on disk for OSM_CACHE_MAX_AGE.
         Returns a list of (lat, lng) tuples.
         """
+        cache_path = os.path.join(OSM_CACHE_DIR, f"osm_{lat}_{lng}_{radius}.json")
+        if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < OSM_CACHE_MAX_AGE:
+            try:
+                with open(cache_path, "rb") as f:
+                    points = [tuple(point) for point in json_loads(f.read())]
+                logger.info(f"Loaded {len(points)} road points from {cache_path}.")
+                return points
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable OSM cache {cache_path}: {e}")
+
         import requests
         try:
             # Query for driving roads (highway) around the point
@@ -104,7 +331,7 @@ class TrafficAnalyzer:
                 out body;
             """
             response = requests.get(overpass_url, params={'data': overpass_query}, timeout=5)
-            data = response.json()
+            data = json_loads(response.content)
             
             nodes = {n['id']: (n['lat'], n['lon']) for n in data['elements'] if n['type'] == 'node'}
             ways = [x for x in data['elements'] if x['type'] == 'way']
@@ -119,11 +346,19 @@ class TrafficAnalyzer:
                         points.append(nodes[nid])
             
             logger.info(f"Fetched {len(points)} road points from OSM.")
-            return points
         except Exception as e:
             logger.error(f"Failed to fetch OSM data: {e}")
             return []
 
+        if points:
+            try:
+                os.makedirs(OSM_CACHE_DIR, exist_ok=True)
+                with open(cache_path, "wb") as f:
+                    f.write(json_dumps(points))
+            except OSError as e:
+                logger.warning(f"Could not cache OSM data: {e}")
+        return points
+
     def _run_pipeline(self):
         if self.mode == "real":
             self._process_cameras()
@@ -133,9 +368,9 @@ class TrafficAnalyzer:
     def _process_cameras(self):
         """
         Multi-Camera Real AI Pipeline.
-        Round-robin processing of all configured video files.
+        All configured video files are read in lockstep, each camera is tracked
+        by its own model instance so track IDs never mix between cameras.
         """
-        import os
         import cv2 # Ensure cv2 is available in this scope
 
         caps = {}
@@ -152,103 +387,198 @@ class TrafficAnalyzer:
                      logger.error(f"No valid video source found for {cam['id']} (and no fallback). Skipping.")
                      continue 
             
-            cap = cv2.VideoCapture(src)
+            cap = VideoSource(src)
             if cap.isOpened():
                 caps[cam["id"]] = cap
+                self._start_encoder(cam["id"])
                 logger.info(f"Initialized {cam['id']} with source {src}")
             else:
                 logger.warning(f"Failed to open source for {cam['id']}")
 
+        # model.track(persist=True) keeps its tracker on the model's predictor, so each
+        # camera gets its own model instance (the loaded one is reused for the first camera)
+        models = {}
+        for cam_id in caps:
+            models[cam_id] = self.model if not models else YOLO(self.model_path, task="detect")
+
+        # Pace the lockstep batch at the slowest camera's native frame rate
+        frame_period = 1.0 / min(cap.fps for cap in caps.values()) if caps else 1.0 / DEFAULT_FPS
+        last_process_ts = 0.0
+
         frame_interval = 3 # Process every Nth frame to save CPU
         frame_count = 0
         cached_annotated_frames = {}  # Store last annotated frame per camera
+        streamed_stamps = {}  # Timestamp text of the last frame sent for encoding, per camera
 
         while self.running:
-            keys = list(caps.keys())
-            for cam_id in keys:
+            wait = last_process_ts + frame_period - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_process_ts = time.monotonic()
+
+            # Grab the current frame from every camera first
+            keys = []
+            frames = []
+            for cam_id in list(caps.keys()):
                 cap = caps[cam_id]
-                ret, frame = cap.read()
-                
+                # Frames come back resized to 1024x576 (larger for better detection of small vehicles).
+                # The source loops internally when the video ends.
+                ret, frame = cap.read_latest()
                 if not ret:
-                    # Loop video
-                    logger.debug(f"Looping {cam_id}")
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    logger.error(f"Lost video source for {cam_id}. Dropping camera.")
+                    cap.release()
+                    del caps[cam_id]
+                    del models[cam_id]
                     continue
                 
-                # Resize for speed (optional, but good for CPU)
-                # Increased to 1024x576 for better detection of small vehicles
-                frame = cv2.resize(frame, (1024, 576))
+                keys.append(cam_id)
+                frames.append(frame)
+
+            if not frames:
+                time.sleep(0.5)
+                continue
 
-                # Frame Skipping Logic
-                frame_count += 1
-                should_run_ai = (frame_count % frame_interval == 0)
+            # Frame Skipping Logic
+            frame_count += 1
+            should_run_ai = (frame_count % frame_interval == 0)
 
+            detections = [] # Per camera results of this AI pass, stored under a single lock acquisition
+            for cam_id, frame in zip(keys, frames):
                 # Use cached annotated frame by default (keeps boxes visible)
                 annotated_frame = cached_annotated_frames.get(cam_id, frame)
 
                 if should_run_ai:
                     # Run Tracking with lowered confidence to catch more vehicles
-                    results = self.model.track(frame, persist=True, verbose=False, conf=0.15)
-                    annotated_frame = results[0].plot()
+                    result = models[cam_id].track(frame, persist=True, tracker=TRACKER_CFG, verbose=False,
+                                                  conf=0.15, **self.predict_kwargs)[0]
+                    annotated_frame = result.plot()
                     # Cache this annotated frame
                     cached_annotated_frames[cam_id] = annotated_frame
 
                     # Count Logic
                     current_counts = {v: 0 for v in self.vehicle_types}
                     current_ids = {v: [] for v in self.vehicle_types} # Store list of IDs per type
+                    all_ids = []
+                    frame_ids = []
                     
-                    if results[0].boxes.id is not None:
-                        boxes = results[0].boxes
-                        track_ids = boxes.id.int().cpu().tolist()
-                        clss = boxes.cls.int().cpu().tolist()
-
-                        for track_id, cls_id in zip(track_ids, clss):
-                            # Add to unique set (global)
-                            self.unique_ids.add(track_id)
-                            
-                            label = self.model.names[cls_id].lower()
-                            if label in ['car', 'motorcycle', 'bus', 'truck']:
-                                type_key = label if label != 'motorcycle' else 'bike'
-                                current_counts[type_key] += 1
-                                current_ids[type_key].append(track_id) # Store ID
-                    
-                    # Update Data Store
-                    with self.lock:
-                        timestamp = datetime.datetime.now().isoformat()
-                        if sum(current_counts.values()) > 0:
-                            for v_type, count in current_counts.items():
-                                if count > 0:
-                                    self.data.append({
-                                        "camera_id": cam_id,
-                                        "camera_name": next(c['name'] for c in self.camera_config if c['id'] == cam_id),
-                                        "lat": next(c['lat'] for c in self.camera_config if c['id'] == cam_id),
-                                        "lng": next(c['lng'] for c in self.camera_config if c['id'] == cam_id),
-                                        "vehicle_type": v_type,
-                                        "count": count,
-                                        "track_ids": current_ids[v_type], # Save the IDs!
-                                        "timestamp": timestamp
-                                    })
-                        # Prune Data
-                        if len(self.data) > 2000: self.data.pop(0)
-
-                # Overlay Timestamp
-                cv2.putText(annotated_frame, datetime.datetime.now().strftime("%H:%M:%S"), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                    if result.boxes.id is not None:
+                        boxes = result.boxes
+                        track_ids = boxes.id.int().cpu().numpy()
+                        clss = boxes.cls.int().cpu().numpy()
+                        all_ids = track_ids.tolist()
+
+                        # Keep vehicle classes only, as indices into self.vehicle_types
+                        types = self.class_map[clss]
+                        keep = types >= 0
+                        vehicle_ids = track_ids[keep]
+                        type_idxs = types[keep]
+                        frame_ids = vehicle_ids.tolist()
+
+                        type_counts = np.bincount(type_idxs, minlength=len(self.vehicle_types))
+                        for type_idx, v_type in enumerate(self.vehicle_types):
+                            if type_counts[type_idx]:
+                                current_counts[v_type] = int(type_counts[type_idx])
+                                current_ids[v_type] = vehicle_ids[type_idxs == type_idx].tolist() # Store IDs
                     
-                # Store Frame for Streaming (Always update this to keep feed smooth)
-                ret, buffer = cv2.imencode('.jpg', annotated_frame)
-                with self.lock:
-                    self.current_frames[cam_id] = buffer.tobytes()
+                    detections.append((cam_id, all_ids, frame_ids, current_counts, current_ids))
+
+                # Between AI frames the streamed image only changes when the timestamp ticks over,
+                # so skip re-encoding an identical frame (raw frames before the first AI pass always change)
+                stamp = datetime.datetime.now().strftime("%H:%M:%S")
+                annotation_changed = should_run_ai or cam_id not in cached_annotated_frames
+                if not annotation_changed and streamed_stamps.get(cam_id) == stamp:
+                    continue
+                streamed_stamps[cam_id] = stamp
+
+                # Overlay Timestamp (on a copy, the encoder thread reads it while we draw the next one)
+                stamped_frame = annotated_frame.copy()
+                cv2.putText(stamped_frame, stamp, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
                     
-                    # Prune Data
-                    if len(self.data) > 2000: self.data.pop(0)
+                # Hand off for Streaming
+                self._submit_frame(cam_id, stamped_frame)
 
-            time.sleep(0.016) # Yield CPU and limit to ~60 FPS
+            if detections:
+                self._store_detections(detections)
+
+    def _store_detections(self, detections):
+        """
+        Updates the data store with one AI pass worth of per-camera results,
+        (cam_id, all_track_ids, vehicle_track_ids, counts_by_type, ids_by_type).
+        """
+        with self.lock:
+            timestamp = time.time() # Epoch seconds, cheap to compare against the live window
+            for cam_id, all_ids, frame_ids, current_counts, current_ids in detections:
+                # Add to unique IDs (global)
+                self._remember_ids(all_ids)
+
+                frame_total = len(frame_ids)
+                if frame_total == 0:
+                    continue
+                self._record_recent(cam_id, timestamp, frame_ids, frame_total)
+                cam = self.camera_by_id[cam_id]
+                for v_type, count in current_counts.items():
+                    if count > 0:
+                        self._store_entry({
+                            "camera_id": cam_id,
+                            "camera_name": cam['name'],
+                            "lat": cam['lat'],
+                            "lng": cam['lng'],
+                            "vehicle_type": v_type,
+                            "count": count,
+                            "track_ids": current_ids[v_type], # Save the IDs!
+                            "timestamp": timestamp
+                        })
+
+    def _start_encoder(self, cam_id):
+        """Starts the background JPEG encoder thread for a camera."""
+        encode_queue = queue.Queue(maxsize=1)
+        self.encode_queues[cam_id] = encode_queue
+        thread = threading.Thread(target=self._encode_frames, args=(cam_id, encode_queue))
+        thread.daemon = True
+        thread.start()
+
+    def _submit_frame(self, cam_id, frame):
+        """Queues a frame for encoding, replacing any frame the encoder hasn't picked up yet."""
+        encode_queue = self.encode_queues[cam_id]
+        try:
+            encode_queue.put_nowait(frame)
+        except queue.Full:
+            try:
+                encode_queue.get_nowait() # Drop the stale frame
+            except queue.Empty:
+                pass
+            try:
+                encode_queue.put_nowait(frame)
+            except queue.Full:
+                pass
+
+    def _encode_frames(self, cam_id, encode_queue):
+        """Encoder thread: turns annotated frames into JPEG bytes for streaming."""
+        while self.running:
+            frame = encode_queue.get()
+            buffer = None
+            if jpeg_encoder is not None:
+                try:
+                    buffer = jpeg_encoder.encode(frame, quality=JPEG_QUALITY)
+                except Exception as e:
+                    # Keep the feed alive, this frame goes through OpenCV instead
+                    logger.error(f"TurboJPEG encode failed for {cam_id}: {e}")
+            if buffer is None:
+                try:
+                    ret, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                except Exception as e:
+                    logger.error(f"Frame encode failed for {cam_id}: {e}")
+                    continue
+                if not ret:
+                    continue
+                buffer = encoded.tobytes()
+            # A single dict item assignment is atomic under the GIL, no lock needed
+            self.current_frames[cam_id] = buffer
 
     def generate_frames(self, camera_id):
         """Yields latest frame for specific camera."""
         while True:
-            with self.lock:
-                frame = self.current_frames.get(camera_id)
+            frame = self.current_frames.get(camera_id)
             
             if frame:
                 yield (b'--frame\r\n'
@@ -265,13 +595,11 @@ class TrafficAnalyzer:
         while self.running:
             with self.lock:
                 self._generate_mock_data_for_other_cams([c["id"] for c in self.camera_config])
-                # Prune
-                if len(self.data) > 1000: self.data.pop(0)
             
             time.sleep(2) # Update every 2 seconds
 
     def _generate_mock_data_for_other_cams(self, cam_ids):
-        timestamp = datetime.datetime.now().isoformat()
+        timestamp = time.time()
         # Use camera_config instead of camera_locations
         for cam in self.camera_config:
             if cam["id"] not in cam_ids: continue
@@ -290,93 +618,110 @@ class TrafficAnalyzer:
                     "count": count,
                     "timestamp": timestamp
                 }
-                self.data.append(entry)
+                self._store_entry(entry)
+                self._record_recent(cam["id"], timestamp, [], count)
+
+    def _remember_ids(self, track_ids):
+        """
+        Marks track IDs as seen, evicting the least recently seen ones so the
+        ID store doesn't grow for the lifetime of the process. Caller must hold self.lock.
+        """
+        for track_id in track_ids:
+            if track_id in self.recent_ids:
+                self.recent_ids.move_to_end(track_id)
+            else:
+                self.recent_ids[track_id] = None
+        while len(self.recent_ids) > MAX_TRACKED_IDS:
+            self.recent_ids.popitem(last=False)
+
+    def _store_entry(self, entry):
+        """
+        Appends a detection entry and keeps the running aggregates in sync,
+        including for the entry the deque evicts. Caller must hold self.lock.
+        """
+        if len(self.data) == self.data.maxlen:
+            old = self.data[0]
+            self.by_type_counter[old['vehicle_type']] -= old['count']
+            self.by_cam_type_counter[old['camera_id']][old['vehicle_type']] -= old['count']
+
+        self.data.append(entry)
+        self.by_type_counter[entry['vehicle_type']] += entry['count']
+        self.by_cam_type_counter[entry['camera_id']][entry['vehicle_type']] += entry['count']
+
+    def _record_recent(self, cam_id, timestamp, track_ids, count):
+        """Pushes one frame's detections into the camera's live window. Caller must hold self.lock."""
+        ids = set(track_ids)
+        self.recent[cam_id].append((timestamp, ids, count))
+        self.recent_id_counts[cam_id].update(ids)
+        self._expire_recent(cam_id, timestamp)
+
+    def _expire_recent(self, cam_id, now):
+        """Drops frames older than RECENT_WINDOW, releasing their track IDs. Caller must hold self.lock."""
+        window = self.recent[cam_id]
+        id_counts = self.recent_id_counts[cam_id]
+        while window and now - window[0][0] >= RECENT_WINDOW:
+            _, ids, _ = window.popleft()
+            for track_id in ids:
+                id_counts[track_id] -= 1
+                if id_counts[track_id] <= 0:
+                    del id_counts[track_id]
 
     def get_latest_data(self):
         with self.lock:
             # Return a summary for the dashboard
-            total_vehicles = len(self.unique_ids)
+            total_vehicles = len(self.recent_ids) # Vehicles seen in the rolling ID window
             
             # Aggregation by vehicle type
-            by_type = {v: 0 for v in self.vehicle_types}
-            for d in self.data:
-                by_type[d['vehicle_type']] += d['count']
+            by_type = {v: self.by_type_counter[v] for v in self.vehicle_types}
                 
             # Aggregation by camera (for map)
             by_camera = {}
+            now = time.time()
             for cam in self.camera_config:
-                cam_data = [d for d in self.data if d['camera_id'] == cam['id']]
-                
                 # Get current "live" count (Unique Track IDs in last 5 seconds)
                 # This is the most robust method. It counts how many UNIQUE vehicles (by ID)
                 # have been seen in the recent window.
+                self._expire_recent(cam['id'], now)
+                window = self.recent[cam['id']]
                 
-                now = datetime.datetime.now()
-                recent_window = datetime.timedelta(seconds=5)
+                # Unique track IDs seen in this window, maintained incrementally
+                current_load = len(self.recent_id_counts[cam['id']])
                 
-                # Filter data for this camera from the last 5 seconds
-                recent_data = [d for d in self.data if d['camera_id'] == cam['id'] and (now - datetime.datetime.fromisoformat(d['timestamp'])) < recent_window]
-                
-                current_load = 0
-                if recent_data:
-                    # Collect all unique track IDs seen in this window
-                    unique_ids_in_window = set()
-                    for d in recent_data:
-                        # Handle both old format (count only) and new format (track_ids list)
-                        # Ideally we updated _process_cameras to save track_ids.
-                        # For now, let's assume we update _process_cameras below or have done so.
-                        # Wait, I need to update _process_cameras first? 
-                        # I will assume I update storing logic in the same file edit or previous.
-                        # Actually, looking at previous edit, I didn't update storage yet.
-                        # So I must update _process_cameras to store 'track_ids'.
-                        ids = d.get('track_ids', [])
-                        unique_ids_in_window.update(ids)
-                    
-                    # If we have IDs, use them. If not (old data/simulated), fall back to max logic?
-                    # The goal is ID counting. I will update _process_cameras to ensure IDs are stored.
-                    current_load = len(unique_ids_in_window)
-                    
-                    # Fallback if no IDs found (e.g. simulated data or if tracking failed to assign IDs)
-                    if current_load == 0 and recent_data:
-                         # Fallback to Max logic just in case
-                        frame_counts = []
-                        timestamps = set(d['timestamp'] for d in recent_data)
-                        for ts in timestamps:
-                            count_in_frame = sum(d['count'] for d in recent_data if d['timestamp'] == ts)
-                            frame_counts.append(count_in_frame)
-                        current_load = max(frame_counts) if frame_counts else 0
+                # Fallback if no IDs found (e.g. simulated data or if tracking failed to assign IDs):
+                # use the busiest single frame in the window
+                if current_load == 0 and window:
+                    current_load = max(count for _, _, count in window)
                 
+                cam_counter = self.by_cam_type_counter[cam['id']]
                 by_camera[cam['id']] = {
                     "lat": cam['lat'],
                     "lng": cam['lng'],
                     "name": cam['name'],
                     "total": current_load, # Use calculated MAX load
                     "lanes": cam.get("lanes", 2), # Default to 2 if missing
-                    "breakdown": {v: sum(d['count'] for d in cam_data if d['vehicle_type'] == v) for v in self.vehicle_types} 
+                    "breakdown": {v: cam_counter[v] for v in self.vehicle_types},
                     # Note: Breakdown is still cumulative from buffer, which is fine for charts, but 'total' is live load
+                    "source_type": cam.get('source_type', 'live_cctv')
                 }
 
             # Generate Simulated Data (with Source Type)
-            current_dummy_data = []
-            for node in self.dummy_nodes:
-                # Random traffic intensity
-                count = random.randint(5, 50) 
-                
-                heading = node.copy()
-                heading.update({
+            # Random traffic intensity, drawn for all nodes at once
+            nodes = self.dummy_nodes # Read once, the OSM thread may swap the list meanwhile
+            dummy_counts = np.random.randint(5, 51, size=len(nodes)).tolist()
+            current_dummy_data = [
+                {
+                    **node,
                     "total": count,
-                     "lanes": 2, # Assume 2 lanes for dummy roads
+                    "lanes": 2, # Assume 2 lanes for dummy roads
                     "breakdown": {"car": count, "bike": 0, "bus": 0, "truck": 0},
                     "source_type": "simulated_cctv"
-                })
-                current_dummy_data.append(heading)
+                }
+                for node, count in zip(nodes, dummy_counts)
+            ]
 
             # Combine real and simulated data
-            # Ensure real camera data has source_type derived from config
+            # (real camera data already carries source_type from config)
             real_locations = list(by_camera.values())
-            for loc in real_locations:
-                 loc['source_type'] = next((c['source_type'] for c in self.camera_config if c['name'] == loc['name']), 'live_cctv')
-
             all_locations = real_locations + current_dummy_data
             
             if not all_locations:
@@ -387,22 +732,12 @@ class TrafficAnalyzer:
             # Yellow (moderate): lanes * 2 < total_vehicles <= lanes * 4
             # Red (congested): total_vehicles > lanes * 4
             
-            for loc in all_locations:
-                val = loc['total']
-                lanes = loc.get('lanes', 2)
-                
-                threshold_green = lanes * 2
-                threshold_yellow = lanes * 4
-                
-                if val <= threshold_green:
-                    loc['intensity'] = 'low'
-                    loc['weighted_intensity'] = 0.2
-                elif val <= threshold_yellow:
-                    loc['intensity'] = 'moderate'
-                    loc['weighted_intensity'] = 0.5
-                else:
-                    loc['intensity'] = 'congestion' # Using 'congestion' map to Red
-                    loc['weighted_intensity'] = 1.0
+            totals = np.fromiter((loc['total'] for loc in all_locations), dtype=np.int32, count=len(all_locations))
+            lanes = np.fromiter((loc.get('lanes', 2) for loc in all_locations), dtype=np.int32, count=len(all_locations))
+            codes = np.where(totals <= lanes * 2, 0, np.where(totals <= lanes * 4, 1, 2)).tolist()
+            
+            for loc, code in zip(all_locations, codes):
+                loc['intensity'], loc['weighted_intensity'] = INTENSITY_LEVELS[code]
 
             # Set dashboard total to the specific live camera count (CAM_002)
             # This replaces the cumulative total with the "Current Vehicles in Frame"
@@ -0,0 +1,6 @@
+# Camera sources for the analytics pipeline
+
+# UPDATED LOCATION: 10°01'22.4"N 76°18'34.2"E -> 10.0229, 76.3095
+CAMERA_CONFIG = [
+    {"id": "CAM_002", "lat": 10.0229, "lng": 76.3095, "name": "Seaport-Airport Rd", "file": "traffic_cam2.mp4", "source_type": "live_cctv", "lanes": 8}
+]
@@ -5,45 +5,92 @@ import json
 
 logger = logging.getLogger("TrafficAI-Chat")
 
+# Configured Gemini model, shared by every ChatService instance
+_model = None
+
 class ChatService:
+    NO_MODEL_RESPONSE = "I'm sorry, but I can't connect to my brain right now (Gemini API Key missing). Please check the server logs."
+    ERROR_RESPONSE = "I encountered an error while processing your request. Please try again later."
+
+    # Static part of the system prompt, appended after the live data
+    PROMPT_INSTRUCTIONS = """
+Instructions:
+1. Answer the user's question concisely based strictly on the above data.
+2. If the user asks about traffic conditions, cite specific numbers and locations.
+3. If a location is 'CONGESTION' or 'HIGH', warn the user.
+4. Keep the tone professional, helpful, and futuristic.
+5. If the answer is not in the data, say you don't have that information.
+"""
+
     def __init__(self):
+        # (snapshot, prompt) of the last traffic snapshot seen; main.py reuses the same
+        # snapshot object across a burst of chat requests
+        self._last_prompt = (None, None)
         self.api_key = os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
             logger.warning("GEMINI_API_KEY not found. Chatbot will return mocked responses.")
             self.model = None
         else:
+            self.model = self._get_model(self.api_key)
+
+    @staticmethod
+    def _get_model(api_key):
+        """
+        Configures Gemini and builds the model once per process.
+        """
+        global _model
+        if _model is None:
             try:
-                genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel('gemini-flash-latest')
+                genai.configure(api_key=api_key)
+                _model = genai.GenerativeModel('gemini-flash-latest')
                 logger.info("Gemini API configured successfully.")
             except Exception as e:
                 logger.error(f"Failed to configure Gemini API: {e}")
-                self.model = None
+        return _model
 
     def get_response(self, user_query, traffic_context):
         """
         Generates a response using Gemini based on the user query and traffic context.
         """
         if not self.model:
-            return "I'm sorry, but I can't connect to my brain right now (Gemini API Key missing). Please check the server logs."
+            return self.NO_MODEL_RESPONSE
 
         try:
-            # Construct System Prompt
-            system_prompt = self._construct_prompt(traffic_context)
-            
-            # Full Prompt
-            full_prompt = f"{system_prompt}\n\nUser Question: {user_query}\nAnswer:"
-            
-            response = self.model.generate_content(full_prompt)
+            response = self.model.generate_content(self._full_prompt(user_query, traffic_context))
             return response.text
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return "I encountered an error while processing your request. Please try again later."
+            return self.ERROR_RESPONSE
+
+    def stream_response(self, user_query, traffic_context):
+        """
+        Same as get_response, but yields the answer in chunks as Gemini generates it.
+        """
+        if not self.model:
+            yield self.NO_MODEL_RESPONSE
+            return
+
+        try:
+            for chunk in self.model.generate_content(self._full_prompt(user_query, traffic_context), stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            yield self.ERROR_RESPONSE
+
+    def _full_prompt(self, user_query, traffic_context):
+        # Construct System Prompt
+        system_prompt = self._construct_prompt(traffic_context)
+        return f"{system_prompt}\n\nUser Question: {user_query}\nAnswer:"
 
     def _construct_prompt(self, data):
         """
         Creates a context-rich prompt from the traffic data.
         """
+        snapshot, prompt = self._last_prompt
+        if snapshot is data:
+            return prompt
+
         total = data.get('total_vehicles', 0)
         locations = data.get('locations', [])
         
@@ -65,12 +112,6 @@ Global Status:
 
 Location Specifics:
 {loc_text}
-
-Instructions:
-1. Answer the user's question concisely based strictly on the above data.
-2. If the user asks about traffic conditions, cite specific numbers and locations.
-3. If a location is 'CONGESTION' or 'HIGH', warn the user.
-4. Keep the tone professional, helpful, and futuristic.
-5. If the answer is not in the data, say you don't have that information.
-"""
+""" + self.PROMPT_INSTRUCTIONS
+        self._last_prompt = (data, prompt)
         return prompt
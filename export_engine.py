@@ -0,0 +1,163 @@
+import os
+import glob
+import json
+import shutil
+import time
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+# Source footage used to calibrate INT8 (same camera angle/lighting as the live feed)
+CALIB_VIDEO = "traffic_cam2.mp4"
+CALIB_DIR = os.path.join("calib", "images")
+CALIB_YAML = "calib.yaml"
+CALIB_FRAMES = 300
+
+# Must match the resize in backend/analytics.py (width, height)
+FRAME_SIZE = (1024, 576)
+
+# Both precisions are kept side by side, backend/analytics.py loads the one recorded in ENGINE_CHOICE_FILE
+INT8_ENGINE = "yolov8n_int8.engine"
+FP16_ENGINE = "yolov8n_fp16.engine"
+ENGINE_CHOICE_FILE = "engine.json"
+
+# An engine's detections on the calibration frames are compared with yolov8n.pt's,
+# INT8 is only used if it keeps at least this agreement (mean per-frame F1 at MATCH_IOU)
+MIN_AGREEMENT = 0.9
+MATCH_IOU = 0.5
+
+def extract_calibration_frames():
+    # Reuse an existing calibration set so re-exports are cheap
+    if os.path.isdir(CALIB_DIR) and len(os.listdir(CALIB_DIR)) >= CALIB_FRAMES:
+        print(f"Using existing calibration frames in {CALIB_DIR}")
+        return
+
+    os.makedirs(CALIB_DIR, exist_ok=True)
+    cap = cv2.VideoCapture(CALIB_VIDEO)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {CALIB_VIDEO}")
+
+    # Spread the samples evenly across the whole clip
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or CALIB_FRAMES
+    step = max(1, total // CALIB_FRAMES)
+
+    saved = 0
+    index = 0
+    while saved < CALIB_FRAMES:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            frame = cv2.resize(frame, FRAME_SIZE)
+            cv2.imwrite(os.path.join(CALIB_DIR, f"frame_{saved:04d}.jpg"), frame)
+            saved += 1
+        index += 1
+    cap.release()
+    print(f"Saved {saved} calibration frames to {CALIB_DIR}")
+
+def write_calibration_yaml():
+    # Ultralytics reads the calibration images from the 'val' split
+    with open(CALIB_YAML, "w") as f:
+        f.write(f"path: {os.path.abspath('calib')}\n")
+        f.write("train: images\n")
+        f.write("val: images\n")
+        f.write("names:\n")
+        for idx, name in YOLO("yolov8n.pt").names.items():
+            f.write(f"  {idx}: {name}\n")
+
+def export_int8_engine():
+    # TensorRT stores the calibration table next to the engine (yolov8n.cache),
+    # so subsequent exports skip the calibration pass.
+    model = YOLO("yolov8n.pt")
+    path = model.export(
+        format="engine",
+        imgsz=(FRAME_SIZE[1], FRAME_SIZE[0]),
+        int8=True,
+        data=CALIB_YAML,
+    )
+    shutil.move(path, INT8_ENGINE)
+    print(f"Exported INT8 engine to {INT8_ENGINE}")
+
+def export_fp16_engine():
+    # No calibration needed, the fallback if INT8 turns out lossy or slower for this scene
+    model = YOLO("yolov8n.pt")
+    path = model.export(
+        format="engine",
+        imgsz=(FRAME_SIZE[1], FRAME_SIZE[0]),
+        half=True,
+    )
+    shutil.move(path, FP16_ENGINE)
+    print(f"Exported FP16 engine to {FP16_ENGINE}")
+
+def detect(model, images):
+    """Returns (boxes, classes) per image and the mean seconds per image, NMS included."""
+    model.predict(images[0], imgsz=(FRAME_SIZE[1], FRAME_SIZE[0]), verbose=False) # Warm-up
+    detections = []
+    start = time.perf_counter()
+    for image in images:
+        boxes = model.predict(image, imgsz=(FRAME_SIZE[1], FRAME_SIZE[0]), verbose=False)[0].boxes.cpu()
+        detections.append((boxes.xyxy.numpy(), boxes.cls.numpy()))
+    return detections, (time.perf_counter() - start) / len(images)
+
+def frame_agreement(reference, candidate):
+    """F1 of one frame's detections against the reference, boxes match on class and IoU >= MATCH_IOU."""
+    ref_boxes, ref_cls = reference
+    boxes, cls = candidate
+    if len(ref_boxes) == 0 or len(boxes) == 0:
+        return 1.0 if len(ref_boxes) == len(boxes) else 0.0
+
+    top_left = np.maximum(ref_boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(ref_boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    ref_area = np.prod(ref_boxes[:, 2:] - ref_boxes[:, :2], axis=1)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    iou = inter / (ref_area[:, None] + area[None, :] - inter + 1e-9)
+    iou[ref_cls[:, None] != cls[None, :]] = 0
+
+    # Greedily pair the best overlapping boxes
+    matched = 0
+    while iou.size:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        if iou[i, j] < MATCH_IOU:
+            break
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return 2 * matched / (len(ref_boxes) + len(boxes))
+
+def select_engine():
+    # Accuracy is checked here rather than at app startup, which only loads the recorded engine
+    engines = [path for path in (INT8_ENGINE, FP16_ENGINE) if os.path.exists(path)]
+    images = [cv2.imread(path) for path in sorted(glob.glob(os.path.join(CALIB_DIR, "*.jpg")))]
+    if not images:
+        # Nothing to validate INT8 against, so stay on the FP16 floor
+        choice = {"engine": FP16_ENGINE if FP16_ENGINE in engines else None}
+    else:
+        reference, _ = detect(YOLO("yolov8n.pt"), images)
+        choice = {"engine": None, "agreement": {}, "latency_ms": {}}
+        for path in engines:
+            detections, latency = detect(YOLO(path, task="detect"), images)
+            agreement = float(np.mean([frame_agreement(r, d) for r, d in zip(reference, detections)]))
+            choice["agreement"][path] = round(agreement, 4)
+            choice["latency_ms"][path] = round(latency * 1000, 2)
+            print(f"{path}: agreement {agreement:.3f}, {latency * 1000:.1f} ms/frame")
+            if path == INT8_ENGINE and agreement < MIN_AGREEMENT:
+                print(f"INT8 agreement is below {MIN_AGREEMENT}, calibration is lossy for this scene. Skipping it.")
+                continue
+            best = choice["engine"]
+            if best is None or latency * 1000 < choice["latency_ms"][best]:
+                choice["engine"] = path
+
+    with open(ENGINE_CHOICE_FILE, "w") as f:
+        json.dump(choice, f, indent=2)
+    print(f"Recorded {choice['engine']} in {ENGINE_CHOICE_FILE}")
+
+if __name__ == "__main__":
+    export_fp16_engine()
+    try:
+        extract_calibration_frames()
+        write_calibration_yaml()
+        export_int8_engine()
+    except Exception as e:
+        print(f"INT8 export failed ({e}), only the FP16 engine will be available")
+    select_engine()
@@ -1,10 +1,31 @@
 from flask import Flask, render_template, jsonify
 from backend.analytics import traffic_system
+from backend.chat_service import ChatService
 from dotenv import load_dotenv
+import json
 import os
+import threading
+import time
 
 load_dotenv()
 
+# Built once after the .env is loaded, reused by every chat request
+chat_service = ChatService()
+
+# Traffic snapshot reused by chat requests for a short while, so a burst of
+# questions doesn't rebuild the data (and prompt) on every message
+CHAT_CONTEXT_TTL = 2.0 # seconds
+_chat_context = {"data": None, "expires": 0.0}
+_chat_context_lock = threading.Lock()
+
+def get_chat_context():
+    now = time.monotonic()
+    with _chat_context_lock:
+        if _chat_context["data"] is None or now >= _chat_context["expires"]:
+            _chat_context["data"] = traffic_system.get_latest_data()
+            _chat_context["expires"] = now + CHAT_CONTEXT_TTL
+        return _chat_context["data"]
+
 app = Flask(__name__)
 
 @app.route('/')
@@ -34,7 +55,6 @@ def get_history():
 @app.route('/api/chat', methods=['POST'])
 def chat():
     from flask import request
-    from backend.chat_service import ChatService
     
     data = request.json
     user_query = data.get('message')
@@ -42,12 +62,32 @@ def chat():
     if not user_query:
         return jsonify({"response": "Please say something!"})
         
-    chat_service = ChatService()
     # Get latest traffic context
-    traffic_data = traffic_system.get_latest_data()
+    traffic_data = get_chat_context()
     
     response = chat_service.get_response(user_query, traffic_data)
     return jsonify({"response": response})
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events version of /api/chat, each event carries a JSON-encoded text chunk."""
+    from flask import request, Response, stream_with_context
+    
+    data = request.json
+    user_query = data.get('message')
+    
+    if not user_query:
+        chunks = iter(["Please say something!"])
+    else:
+        # Get latest traffic context
+        traffic_data = get_chat_context()
+        chunks = chat_service.stream_response(user_query, traffic_data)
+    
+    def generate():
+        for text in chunks:
+            yield f"data: {json.dumps(text)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
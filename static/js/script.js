@@ -78,19 +78,46 @@ document.addEventListener('DOMContentLoaded', () => {
         chatMessages.scrollTop = chatMessages.scrollHeight;
 
         try {
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ message: text })
             });
-            const data = await response.json();
-
-            // Remove Loading
-            const loader = document.getElementById('chat-loading');
-            if (loader) loader.remove();
+            if (!response.ok) throw new Error(`Chat request failed with status ${response.status}`);
+
+            // 3. Stream AI Response (Server-Sent Events, one JSON string per event)
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let answer = '';
+            let botDiv = null;
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split('\n\n');
+                buffer = events.pop(); // Keep the incomplete event for the next read
+                for (const event of events) {
+                    if (!event.startsWith('data: ')) continue;
+                    answer += JSON.parse(event.slice(6));
+
+                    if (!botDiv) {
+                        // Replace the loader with the message on the first chunk
+                        const loader = document.getElementById('chat-loading');
+                        if (loader) loader.remove();
+                        addMessage(answer, 'bot');
+                        botDiv = chatMessages.lastElementChild;
+                    } else {
+                        botDiv.innerHTML = marked.parse(answer);
+                        chatMessages.scrollTop = chatMessages.scrollHeight;
+                    }
+                }
+            }
 
-            // 3. Add AI Response
-            addMessage(data.response, 'bot');
+            // Stream ended without any answer
+            if (!botDiv) throw new Error('Empty chat response');
 
         } catch (error) {
             console.error('Chat error:', error);